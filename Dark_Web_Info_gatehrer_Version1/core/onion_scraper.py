@@ -1,6 +1,8 @@
 # core/onion_scraper.py
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 class OnionScraper:
     def __init__(self, proxy):
@@ -8,15 +10,22 @@ class OnionScraper:
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
         }
+        # One pooled session shared by all scraping threads, so the SOCKS
+        # connections to Tor are reused across requests
+        self.session = requests.Session()
+        self.session.proxies = proxy
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=1)
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
     def scrape_site(self, url):
         try:
-            response = requests.get(
-                url,
-                proxies=self.proxies,
-                headers=self.headers,
-                timeout=15
-            )
+            response = self.session.get(url, timeout=15)
             if response.status_code == 200:
                 print("📄 Page fetched successfully.")
                 return response.text
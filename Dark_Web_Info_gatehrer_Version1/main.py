@@ -1,5 +1,6 @@
 # main.py
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from core.tor_controller import TorController
 from core.onion_scraper import OnionScraper
 from core.data_manager import DataManager
@@ -24,9 +25,16 @@ def main():
 
     all_data = []
 
+    # Fetch sites in parallel; Tor requests are I/O-bound
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        futures = {}
+        for url in onion_sites:
+            print(f"🌐 Scraping: {url}")
+            futures[ex.submit(scraper.scrape_site, url)] = url
+        pages = {futures[f]: f.result() for f in as_completed(futures)}
+
     for url in onion_sites:
-        print(f"🌐 Scraping: {url}")
-        content = scraper.scrape_site(url)
+        content = pages[url]
         if content:
             all_data.append({
                 "url": url,
@@ -6,19 +6,89 @@ Secure storage and handling of collected dark web data with encryption.
 
 import os
 import json
+import base64
+import time
+import atexit
 import sqlite3
 from datetime import datetime
 import hashlib
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Leading byte of the key file and of every AES-GCM content blob. Legacy
+# Fernet keys and tokens are base64 text, so they never start with it.
+CRYPTO_VERSION = b'\x01'
+NONCE_SIZE = 12
+
+# First byte of decrypted content: UTF-8 text, raw bytes or JSON. Content
+# stored before the tags existed is plain JSON, which never starts with these.
+CONTENT_TEXT = b'S'
+CONTENT_BYTES = b'B'
+CONTENT_JSON = b'J'
+
+STATS_TTL = 30  # Seconds get_stats() results are reused
+
+def _json_default(obj):
+    """Encode dates and times as ISO 8601 strings, matching orjson"""
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _export_default(obj):
+    """Like _json_default, but also writes bytes content as base64 text"""
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode('ascii')
+    return _json_default(obj)
+
+def _json_dumps(obj, indent=False, default=_json_default):
+    """Serialize obj to JSON bytes, using orjson when available"""
+    if orjson is not None:
+        # Accept non-str dict keys like the json fallback does
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default, option=option)
+    # Same bytes as orjson's output, so content hashes don't depend on the backend
+    return json.dumps(obj, indent=2 if indent else None,
+                      separators=None if indent else (',', ':'),
+                      ensure_ascii=False, default=default).encode()
+
+def _json_loads(data):
+    """Deserialize JSON from bytes or str, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
 class DataManager:
+    _INSERT_SQL = '''
+        INSERT OR IGNORE INTO collected_data (
+            data_type, title, url, content, source_hash, domain
+        ) VALUES (?, ?, ?, ?, ?, ?)
+    '''
+
+    _META_SQL = '''
+        INSERT INTO scan_metadata (
+            scan_start, items_collected, domains_scanned
+        ) VALUES (?, ?, ?)
+    '''
+
     def __init__(self, db_name="darkweb_data.db"):
         self.db_name = db_name
         self.key_file = "data_key.key"
-        self.cipher = self._init_crypto()
+        self.aead, self.legacy_cipher = self._init_crypto()
         self.logger = self._init_logging()
-        self._init_db()
+        # One long-lived connection, so sqlite3's statement cache is reused
+        self._conn = None
+        self._get_conn()
+        self._stats_cache = None
+        self._stats_cache_time = 0
+        atexit.register(self.close)
 
     def _init_logging(self):
         """Initialize secure logging"""
@@ -36,57 +106,193 @@ class DataManager:
 
     def _init_crypto(self):
         """Initialize encryption system"""
-        if not os.path.exists(self.key_file):
-            key = Fernet.generate_key()
+        key = legacy_key = None
+
+        if os.path.exists(self.key_file):
+            with open(self.key_file, 'rb') as f:
+                key_data = f.read()
+
+            if key_data.startswith(CRYPTO_VERSION):
+                key = key_data[1:33]
+                legacy_key = key_data[33:] or None
+            else:
+                # Old Fernet key file: keep it alongside a new AES key so
+                # previously stored content can still be decrypted
+                legacy_key = key_data.strip()
+
+        if key is None:
+            key = AESGCM.generate_key(bit_length=256)
             with open(self.key_file, 'wb') as f:
-                f.write(key)
-        
-        with open(self.key_file, 'rb') as f:
-            key = f.read()
-        
-        return Fernet(key)
+                f.write(CRYPTO_VERSION + key + (legacy_key or b''))
+
+        return AESGCM(key), Fernet(legacy_key) if legacy_key else None
+
+    def _connect(self):
+        """Open a database connection with per-connection PRAGMAs applied"""
+        conn = sqlite3.connect(self.db_name, check_same_thread=False,
+                               isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=30000000000")
+        conn.execute("PRAGMA cache_size=-64000")
+        return conn
+
+    def _get_conn(self):
+        """Return the shared connection, reopening storage after close() or wipe()"""
+        if self._conn is None:
+            if self.aead is None:
+                self.aead, self.legacy_cipher = self._init_crypto()
+            self._conn = self._connect()
+            try:
+                self._init_db()
+            except Exception:
+                self._conn.close()
+                self._conn = None
+                raise
+        return self._conn
+
+    def close(self):
+        """Close the database connection"""
+        if self._conn is not None:
+            # Let SQLite refresh query planner statistics if it sees a need
+            try:
+                self._conn.execute('PRAGMA optimize')
+            except sqlite3.Error:
+                pass
+            self._conn.close()
+            self._conn = None
 
     def _init_db(self):
         """Initialize secure database"""
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            
-            # Main data table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS collected_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    data_type TEXT NOT NULL,
-                    title TEXT NOT NULL,
-                    url TEXT UNIQUE NOT NULL,
-                    content BLOB,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    source_hash TEXT UNIQUE,
-                    is_sensitive INTEGER DEFAULT 0
-                )
-            ''')
-            
-            # Metadata table
+        cursor = self._conn.cursor()
+
+        # WAL is persistent in the database file, so it only needs setting once
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA journal_size_limit=6144000")
+        
+        # Main data table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS collected_data (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                data_type TEXT NOT NULL,
+                title TEXT NOT NULL,
+                url TEXT UNIQUE NOT NULL,
+                content BLOB,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                source_hash TEXT UNIQUE,
+                is_sensitive INTEGER DEFAULT 0,
+                domain TEXT
+            )
+        ''')
+
+        # Databases created before the domain column existed
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(collected_data)')]
+        if 'domain' not in columns:
+            cursor.execute('ALTER TABLE collected_data ADD COLUMN domain TEXT')
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS scan_metadata (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    scan_start DATETIME,
-                    scan_end DATETIME,
-                    items_collected INTEGER,
-                    domains_scanned TEXT
-                )
+                UPDATE collected_data SET domain = CASE
+                    WHEN instr(substr(url, instr(url, '://') + 3), '/') > 0
+                    THEN substr(substr(url, instr(url, '://') + 3), 1,
+                                instr(substr(url, instr(url, '://') + 3), '/') - 1)
+                    ELSE substr(url, instr(url, '://') + 3)
+                END
             ''')
-            
-            conn.commit()
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_timestamp
+            ON collected_data(timestamp DESC)
+        ''')
+        
+        # Metadata table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scan_metadata (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                scan_start DATETIME,
+                scan_end DATETIME,
+                items_collected INTEGER,
+                domains_scanned TEXT
+            )
+        ''')
 
     def _encrypt_data(self, data):
         """Encrypt sensitive data before storage"""
-        if isinstance(data, str):
-            data = data.encode()
-        return self.cipher.encrypt(data)
+        nonce = os.urandom(NONCE_SIZE)
+        return CRYPTO_VERSION + nonce + self.aead.encrypt(nonce, data, None)
 
     def _decrypt_data(self, encrypted_data):
         """Decrypt stored data"""
-        return self.cipher.decrypt(encrypted_data).decode()
+        if encrypted_data[:1] != CRYPTO_VERSION:
+            if self.legacy_cipher is None:
+                raise ValueError("No key available for legacy Fernet content")
+            return self.legacy_cipher.decrypt(encrypted_data)
+
+        nonce = encrypted_data[1:1 + NONCE_SIZE]
+        return self.aead.decrypt(nonce, encrypted_data[1 + NONCE_SIZE:], None)
+
+    def _encode_content(self, content):
+        """Serialize content for encryption, skipping JSON for plain text"""
+        if isinstance(content, str):
+            return CONTENT_TEXT + content.encode()
+        if isinstance(content, bytes):
+            return CONTENT_BYTES + content
+        return CONTENT_JSON + _json_dumps(content)
+
+    def _decode_content(self, data):
+        """Inverse of _encode_content"""
+        tag = data[:1]
+        if tag == CONTENT_TEXT:
+            return data[1:].decode()
+        if tag == CONTENT_BYTES:
+            return data[1:]
+        if tag == CONTENT_JSON:
+            return _json_loads(data[1:])
+        return _json_loads(data)
+
+    def _content_hash(self, url, encoded_content):
+        """Hash url and encoded content incrementally, without concatenating them"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(url.encode())
+        h.update(encoded_content)
+        return h.hexdigest()
+
+    def _prepare_rows(self, items):
+        """Build insert rows for items, returning them with the set of domains"""
+        domains = set()
+        rows = []
+
+        for item in items:
+            try:
+                url = item['url']
+                content = item.get('content', '')
+                encoded_content = self._encode_content(content)
+
+                # Generate content hash for deduplication over the same
+                # bytes that get stored, so one serializer decides storability
+                content_hash = self._content_hash(url, encoded_content)
+                
+                # Encrypt sensitive content
+                encrypted_content = self._encrypt_data(
+                    encoded_content
+                ) if content else None
+                
+                # Extract domain without splitting the whole path
+                domain = url.split('/', 3)[2]
+                
+                rows.append((
+                    item.get('type', 'unknown'),
+                    item.get('title', 'No title')[:500],  # Truncate long titles
+                    url,
+                    encrypted_content,
+                    content_hash,
+                    domain
+                ))
+                domains.add(domain)
+                
+            except Exception as e:
+                self.logger.error(f"Failed to save item {item.get('url')}: {str(e)}")
+                continue
+
+        return rows, domains
 
     def save(self, items):
         """Save collected items to secure database"""
@@ -94,152 +300,162 @@ class DataManager:
             return False
 
         scan_start = datetime.now()
-        domains = set()
-        saved_count = 0
+        conn = self._get_conn()
+        rows, domains = self._prepare_rows(items)
 
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            
-            for item in items:
-                try:
-                    # Generate content hash for deduplication
-                    content_hash = hashlib.sha256(
-                        (item.get('url', '') + str(item.get('content', ''))).encode()
-                    ).hexdigest()
-                    
-                    # Encrypt sensitive content
-                    encrypted_content = self._encrypt_data(
-                        json.dumps(item.get('content', ''))
-                    ) if item.get('content') else None
-                    
-                    # Extract domain
-                    domain = item['url'].split('/')[2] if 'url' in item else 'unknown'
-                    domains.add(domain)
-                    
-                    cursor.execute('''
-                        INSERT OR IGNORE INTO collected_data (
-                            data_type, title, url, content, source_hash
-                        ) VALUES (?, ?, ?, ?, ?)
-                    ''', (
-                        item.get('type', 'unknown'),
-                        item.get('title', 'No title')[:500],  # Truncate long titles
-                        item['url'],
-                        encrypted_content,
-                        content_hash
-                    ))
-                    
-                    saved_count += cursor.rowcount
-                    
-                except Exception as e:
-                    self.logger.error(f"Failed to save item {item.get('url')}: {str(e)}")
-                    continue
+        conn.execute('BEGIN')
+        try:
+            # Insert all rows in one batch; ignored duplicates don't count as
+            # changes. INSERT ... RETURNING can't replace this diff: sqlite3's
+            # executemany() discards the returned rows.
+            changes_before = conn.total_changes
+            conn.executemany(self._INSERT_SQL, rows)
+            saved_count = conn.total_changes - changes_before
 
             # Record scan metadata
-            cursor.execute('''
-                INSERT INTO scan_metadata (
-                    scan_start, items_collected, domains_scanned
-                ) VALUES (?, ?, ?)
-            ''', (
+            conn.execute(self._META_SQL, (
                 scan_start,
                 saved_count,
                 ','.join(list(domains)[:10])  # Store first 10 domains
             ))
             
-            conn.commit()
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        self._stats_cache = None
 
         self.logger.info(f"Saved {saved_count}/{len(items)} items from {len(domains)} domains")
         return saved_count > 0
 
+    def _decode_row(self, row, decrypt_content):
+        """Convert a database row to a dict, decrypting content if requested"""
+        item = dict(row)
+        
+        if decrypt_content and item['content']:
+            try:
+                item['content'] = self._decode_content(
+                    self._decrypt_data(item['content'])
+                )
+            except:
+                item['content'] = "[ENCRYPTED CONTENT]"
+        
+        return item
+
     def load(self, limit=100, decrypt_content=True):
         """Load collected data with optional decryption"""
-        results = []
+        cursor = self._get_conn().cursor()
+        cursor.row_factory = sqlite3.Row
         
-        with sqlite3.connect(self.db_name) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT * FROM collected_data
-                ORDER BY timestamp DESC
-                LIMIT ?
-            ''', (limit,))
-            
-            for row in cursor.fetchall():
-                item = dict(row)
-                
-                if decrypt_content and item['content']:
-                    try:
-                        item['content'] = json.loads(
-                            self._decrypt_data(item['content'])
-                        )
-                    except:
-                        item['content'] = "[ENCRYPTED CONTENT]"
-                
-                results.append(item)
+        cursor.execute('''
+            SELECT * FROM collected_data
+            ORDER BY timestamp DESC
+            LIMIT ?
+        ''', (limit,))
         
-        return results
+        return [self._decode_row(row, decrypt_content) for row in cursor.fetchall()]
+
+    def iter_items(self, decrypt_content=True):
+        """Yield every collected item one row at a time"""
+        cursor = self._get_conn().cursor()
+        cursor.row_factory = sqlite3.Row
+        
+        cursor.execute('''
+            SELECT * FROM collected_data
+            ORDER BY timestamp DESC
+        ''')
+        
+        for row in cursor:
+            yield self._decode_row(row, decrypt_content)
 
     def get_stats(self):
-        """Get collection statistics"""
+        """Get collection statistics, reusing results for up to STATS_TTL seconds"""
+        now = time.monotonic()
+        if self._stats_cache and now - self._stats_cache_time < STATS_TTL:
+            return dict(self._stats_cache)
+
         stats = {
             'total': 0,
             'domains': 0,
             'last_updated': 'Never'
         }
         
-        with sqlite3.connect(self.db_name) as conn:
-            cursor = conn.cursor()
-            
-            # Get total items
-            cursor.execute('SELECT COUNT(*) FROM collected_data')
-            stats['total'] = cursor.fetchone()[0]
-            
-            # Get unique domains
-            cursor.execute('''
-                SELECT COUNT(DISTINCT substr(url, 0, instr(substr(url, 9), '/'))
-                FROM collected_data
-            ''')
-            stats['domains'] = cursor.fetchone()[0]
-            
-            # Get last update time
-            cursor.execute('''
-                SELECT MAX(timestamp) FROM collected_data
-            ''')
-            last_update = cursor.fetchone()[0]
-            if last_update:
-                stats['last_updated'] = last_update
+        cursor = self._get_conn().execute('''
+            SELECT COUNT(*), COUNT(DISTINCT domain), MAX(timestamp)
+            FROM collected_data
+        ''')
+        stats['total'], stats['domains'], last_update = cursor.fetchone()
+        if last_update:
+            stats['last_updated'] = last_update
         
-        return stats
+        self._stats_cache = stats
+        self._stats_cache_time = now
+        return dict(stats)
 
     def export(self, output_file, format='json'):
         """Export data securely"""
-        data = self.load(decrypt_content=True)
+        count = 0
         
         if format.lower() == 'json':
-            with open(output_file, 'w') as f:
-                json.dump(data, f, indent=2)
-            self.logger.info(f"Exported {len(data)} items to {output_file}")
+            # Write items as they are read so memory use doesn't grow with the DB
+            with open(output_file, 'wb') as f:
+                f.write(b'[\n')
+                for item in self.iter_items(decrypt_content=True):
+                    if count:
+                        f.write(b',\n')
+                    f.write(_json_dumps(item, indent=True, default=_export_default))
+                    count += 1
+                f.write(b'\n]\n')
+            self.logger.info(f"Exported {count} items to {output_file}")
             return True
         
         elif format.lower() == 'csv':
             import csv
+            fieldnames = [col[1] for col in self._get_conn().execute('PRAGMA table_info(collected_data)')]
             with open(output_file, 'w', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=data[0].keys())
+                writer = csv.DictWriter(f, fieldnames=fieldnames)
                 writer.writeheader()
-                writer.writerows(data)
-            self.logger.info(f"Exported {len(data)} items to {output_file}")
+                for item in self.iter_items(decrypt_content=True):
+                    writer.writerow(item)
+                    count += 1
+            self.logger.info(f"Exported {count} items to {output_file}")
             return True
         
         return False
 
+    def _overwrite_file(self, path, chunk_size=1 << 20):
+        """
+        Overwrite a file in place with random bytes, one chunk at a time.
+        This is only basic sanitization: SSDs and copy-on-write or TRIM-aware
+        file systems may keep the old blocks, so a real secure erase needs
+        tools like shred or blkdiscard on the underlying device.
+        """
+        size = os.path.getsize(path)
+        written = 0
+
+        with open(path, 'r+b') as f:
+            while written < size:
+                n = min(chunk_size, size - written)
+                f.write(os.urandom(n))
+                written += n
+            f.flush()
+            os.fsync(f.fileno())
+
     def wipe(self):
         """Securely wipe sensitive data"""
         try:
-            if os.path.exists(self.db_name):
-                # Overwrite file before deletion (basic sanitization)
-                with open(self.db_name, 'wb') as f:
-                    f.write(os.urandom(os.path.getsize(self.db_name)))
-                os.remove(self.db_name)
+            self.close()
+            self._stats_cache = None
+            # Drop the in-memory key too; storage is recreated on next use
+            self.aead = self.legacy_cipher = None
+
+            # WAL mode keeps recent writes in sidecar files next to the database
+            for path in (self.db_name, self.db_name + '-wal', self.db_name + '-shm'):
+                if os.path.exists(path):
+                    # Overwrite file before deletion (basic sanitization)
+                    self._overwrite_file(path)
+                    os.remove(path)
                 
             if os.path.exists(self.key_file):
                 os.remove(self.key_file)
@@ -6,22 +6,85 @@ Specialized web scraper for .onion sites with Tor anonymity.
 
 import time
 import random
+import asyncio
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin
 from fake_useragent import UserAgent
 import re
+from core.tor_controller import TorController
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+try:
+    from pybloom_live import ScalableBloomFilter
+except ImportError:
+    ScalableBloomFilter = None
+
+IGNORED_TAGS = ["script", "style", "iframe", "noscript"]
+
+class VisitedURLs:
+    """
+    Set of crawled URLs that stays exact for the first exact_limit entries,
+    then records further URLs in a scalable Bloom filter to bound memory
+    """
+    def __init__(self, exact_limit=2000):
+        self.exact_limit = exact_limit
+        self.clear()
+
+    def clear(self):
+        self._exact = set()
+        self._bloom = None
+
+    def add(self, url):
+        if len(self._exact) < self.exact_limit or ScalableBloomFilter is None:
+            self._exact.add(url)
+            return
+
+        if self._bloom is None:
+            self._bloom = ScalableBloomFilter(
+                initial_capacity=10000,
+                error_rate=1e-5,
+                mode=ScalableBloomFilter.LARGE_SET_GROWTH
+            )
+        self._bloom.add(url)
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def __contains__(self, url):
+        return url in self._exact or (self._bloom is not None and url in self._bloom)
 
 class OnionScraper:
     def __init__(self):
-        self.visited_urls = set()
+        self.visited_urls = VisitedURLs()
         self.ua = UserAgent()
+        self._ua_pool = tuple(self.ua.random for _ in range(64))
+        self.tor = TorController()
+        self.max_concurrency = 5  # Simultaneous in-flight fetches
         self.max_retries = 3
         self.timeout = 30
+        self.max_page_bytes = 512 * 1024  # Stop reading oversized pages
         self.request_delay = (3, 7)  # Random delay between requests
         self.blacklist = [
             r"\.exe$", r"\.zip$", r"\.rar$", r"\.tar$", r"\.gz$",
             r"\.mp3$", r"\.mp4$", r"\.avi$", r"\.mkv$", r"\.pdf$"
         ]
+        self._blacklist_re = re.compile("|".join(self.blacklist), re.IGNORECASE)
+        # v2 (16 char) and v3 (56 char) onion addresses
+        self._onion_re = re.compile(
+            r'^https?://([a-z2-7]{16}|[a-z2-7]{56})\.onion(?:[:/?#]|$)',
+            re.IGNORECASE
+        )
 
     def scrape(self, onion_url, depth=1):
         """
@@ -35,7 +98,7 @@ class OnionScraper:
         self.visited_urls.clear()
         
         try:
-            self._crawl(onion_url, depth, results)
+            asyncio.run(self._crawl(onion_url, depth, results))
         except Exception as e:
             print(f"[!] Scraping interrupted: {str(e)}")
         
@@ -64,95 +127,137 @@ class OnionScraper:
         
         return simulated_results
 
-    def _crawl(self, url, depth, results, current_depth=0):
-        """Recursive crawling function with depth control"""
-        if current_depth > depth or url in self.visited_urls:
-            return
+    async def _crawl(self, url, depth, results):
+        """Breadth-first crawl, fetching each depth level concurrently"""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        frontier = [url]
 
-        self.visited_urls.add(url)
-        print(f"[+] Crawling: {url} (depth {current_depth})")
+        for current_depth in range(depth + 1):
+            frontier = [u for u in dict.fromkeys(frontier) if u not in self.visited_urls]
+            if not frontier:
+                break
+            self.visited_urls.update(frontier)
 
-        try:
-            html_content = self._fetch_url(url)
-            if not html_content:
-                return
+            pages = await asyncio.gather(*(
+                self._crawl_page(u, current_depth, semaphore) for u in frontier
+            ))
 
-            # Extract page information
-            page_data = self._extract_page_data(url, html_content)
-            if page_data:
-                results.append(page_data)
+            frontier = []
+            for page_data, links in pages:
+                if page_data:
+                    results.append(page_data)
+                # Follow links only if not at max depth
+                if current_depth < depth:
+                    frontier.extend(links)
 
-            # Extract and follow links if not at max depth
-            if current_depth < depth:
-                for link in self._extract_links(url, html_content):
-                    time.sleep(random.uniform(*self.request_delay))
-                    self._crawl(link, depth, results, current_depth + 1)
+    async def _crawl_page(self, url, current_depth, semaphore):
+        """Fetch a single page and return its data and outgoing links"""
+        async with semaphore:
+            print(f"[+] Crawling: {url} (depth {current_depth})")
 
-        except Exception as e:
-            print(f"[!] Failed to crawl {url}: {str(e)}")
+            try:
+                # requests is blocking, so run the fetch in a worker thread
+                html_content = await asyncio.to_thread(self._fetch_url, url)
+                if not html_content:
+                    return None, []
+
+                return self._parse_page(url, html_content)
+
+            except Exception as e:
+                print(f"[!] Failed to crawl {url}: {str(e)}")
+                return None, []
 
     def _fetch_url(self, url):
         """Fetch URL content with retries and random delays"""
-        from core.tor_controller import TorController
-        tor = TorController()
-        session = tor.get_session()
+        session = self.tor.get_session()
+
+        # Rotate user agent per URL. The session is shared between worker
+        # threads, so headers are passed per request.
+        headers = {'User-Agent': random.choice(self._ua_pool)}
 
         for attempt in range(self.max_retries):
             try:
-                # Rotate user agent and add random delay
-                session.headers.update({'User-Agent': self.ua.random})
+                # Add random delay
                 time.sleep(random.uniform(*self.request_delay))
 
-                response = session.get(
+                with session.get(
                     url,
+                    headers=headers,
                     timeout=self.timeout,
-                    allow_redirects=False
-                )
-
-                if response.status_code == 200:
-                    return response.text
-                elif response.status_code in (403, 404):
-                    return None
-                else:
-                    print(f"[!] HTTP {response.status_code} at {url}")
-                    return None
+                    allow_redirects=False,
+                    stream=True
+                ) as response:
+                    if response.status_code == 200:
+                        return self._read_limited(response)
+                    elif response.status_code in (403, 404):
+                        return None
+                    else:
+                        print(f"[!] HTTP {response.status_code} at {url}")
+                        return None
 
             except Exception as e:
                 print(f"[!] Attempt {attempt + 1} failed: {str(e)}")
                 if attempt == self.max_retries - 1:
                     raise
                 time.sleep(5)
-                tor.renew_identity()
+                self.tor.renew_identity()
 
         return None
 
-    def _extract_page_data(self, url, html):
-        """Extract structured data from page HTML"""
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        # Remove scripts and styles
-        for script in soup(["script", "style", "iframe", "noscript"]):
-            script.decompose()
+    def _read_limited(self, response):
+        """Read at most max_page_bytes of a streamed response body"""
+        chunks = []
+        total = 0
+        for chunk in response.iter_content(16384):
+            chunks.append(chunk)
+            total += len(chunk)
+            if total >= self.max_page_bytes:
+                break
+
+        data = b''.join(chunks)[:self.max_page_bytes]
+        return data.decode(response.encoding or 'utf-8', errors='replace')
+
+    def _parse_page(self, url, html):
+        """Parse page HTML once, returning its structured data and links"""
+        if HTMLParser is not None:
+            tree = HTMLParser(html)
+            tree.strip_tags(IGNORED_TAGS)
 
-        title = soup.title.string if soup.title else url
-        text = ' '.join(soup.stripped_strings)
+            title_node = tree.css_first('title')
+            title = title_node.text(strip=True) if title_node else url
+            root = tree.body or tree.root
+            text = root.text(separator=' ', strip=True) if root else ''
+            anchors = tree.css('a')
+            hrefs = [a.attributes.get('href') or '' for a in anchors]
+        else:
+            soup = BeautifulSoup(html, HTML_PARSER)
+            
+            # Remove scripts and styles
+            for script in soup(IGNORED_TAGS):
+                script.decompose()
+
+            title = soup.title.string if soup.title else url
+            text = ' '.join(soup.stripped_strings)
+            anchors = soup.find_all('a')
+            hrefs = [a.get('href', '') for a in anchors]
         
-        return {
+        page_data = {
             'type': 'page',
             'title': title[:200],  # Limit title length
             'url': url,
             'content': text[:5000],  # Limit content size
             'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"),
-            'links': len(soup.find_all('a'))
+            'links': len(anchors)
         }
 
-    def _extract_links(self, base_url, html):
-        """Extract and validate links from page content"""
-        soup = BeautifulSoup(html, 'html.parser')
+        return page_data, self._filter_links(url, hrefs)
+
+    def _filter_links(self, base_url, hrefs):
+        """Resolve and validate hrefs found on a page"""
         links = set()
 
-        for a in soup.find_all('a', href=True):
-            href = a['href'].strip()
+        for href in hrefs:
+            href = href.strip()
             if not href or href.startswith(('javascript:', 'mailto:', '#')):
                 continue
 
@@ -166,14 +271,8 @@ class OnionScraper:
 
     def _validate_onion_url(self, url):
         """Validate that URL is a proper .onion address"""
-        try:
-            parsed = urlparse(url)
-            return (parsed.scheme in ('http', 'https') and 
-                    parsed.netloc.endswith('.onion') and
-                    len(parsed.netloc) == 22)  # Standard v2 onion address
-        except:
-            return False
+        return self._onion_re.match(url) is not None
 
     def _is_blacklisted(self, url):
         """Check if URL matches any blacklist pattern"""
-        return any(re.search(pattern, url.lower()) for pattern in self.blacklist)
\ No newline at end of file
+        return self._blacklist_re.search(url) is not None
\ No newline at end of file